@@ -1,10 +1,13 @@
+import os
 import time
+import socket
 import logging
 from googleapiclient.discovery import build
 from database import Database
 from auth_manager import AuthManager
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly','https://www.googleapis.com/auth/gmail.modify']
+RETRY_BACKOFF_SECONDS = 5
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -70,26 +73,35 @@ def execute_action(service, email_id: str, action: str, db) -> bool:
         logger.error(f"Error executing action {action} on email {email_id}: {str(e)}")
         return False
 
+def process_pending_actions(service, db, worker_id: str) -> int:
+    pending_actions = db.claim_pending_actions(worker_id)
+    logger.info(f"Worker {worker_id} claimed {len(pending_actions)} pending actions")
+    for action in pending_actions:
+        success = execute_action(service, action['email_id'], action['action'], db)
+        if success:
+            updated = db.update_action_status(action['id'], 'success', worker_id=worker_id)
+        else:
+            retry_count = action['retry_count'] + 1
+            if retry_count < 3:
+                retry_delay = RETRY_BACKOFF_SECONDS * 2 ** (retry_count - 1)
+                updated = db.update_action_status(action['id'], 'pending', retry_count, retry_delay,
+                                                  worker_id=worker_id)
+            else:
+                updated = db.update_action_status(action['id'], 'failed', worker_id=worker_id)
+        if not updated:
+            logger.warning(f"Lease on action {action['id']} was lost to another worker; status not updated")
+    return len(pending_actions)
+
 def main():
     db = Database()
     creds = authenticate()
     service = build('gmail', 'v1', credentials=creds)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
     
     while True:
         try:
-            pending_actions = db.get_pending_actions()
-            logger.info(f"Found {len(pending_actions)} pending actions")
-            for action in pending_actions:
-                success = execute_action(service, action['email_id'], action['action'], db)
-                if success:
-                    db.update_action_status(action['id'], 'success')
-                else:
-                    retry_count = action['retry_count'] + 1
-                    if retry_count < 3:
-                        db.update_action_status(action['id'], 'pending', retry_count)
-                    else:
-                        db.update_action_status(action['id'], 'failed')
-            time.sleep(5)
+            if not process_pending_actions(service, db, worker_id):
+                time.sleep(5)
         except Exception as e:
             logger.error(f"Error in action taker: {str(e)}")
             time.sleep(5)
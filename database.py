@@ -1,16 +1,46 @@
 import sqlite3
 import datetime
+import logging
+import time
 from typing import List, Dict, Optional
 
+logger = logging.getLogger(__name__)
+
+# Days a row stays in the hot DB before it is moved to the archive DB, counted
+# from completed_at for actions and fetched_at for emails. Pending actions are never archived.
+DEFAULT_RETENTION_DAYS = {
+    'success': 30,
+    'failed': 90,
+    'emails': 90,
+}
+
+ACTION_QUEUE_COLUMNS = ['id', 'email_id', 'action', 'status', 'retry_count', 'from_rule_name', 'created_at',
+                        'completed_at']
+EMAIL_COLUMNS = ['id', 'sender', 'subject', 'snippet', 'received', 'is_read', 'is_processed', 'fetched_at']
+
 class Database:
-    def __init__(self, db_path: str = 'rulemate.db'):
+    def __init__(self, db_path: str = 'rulemate.db', archive_path: str = 'rulemate_archive.db',
+                 retention_days: Optional[Dict[str, int]] = None):
         self.db_path = db_path
+        self.archive_path = archive_path
+        self.retention_days = {**DEFAULT_RETENTION_DAYS, **(retention_days or {})}
         self._initialize_db()
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, isolation_level=None) as conn:
             cursor = conn.cursor()
-            
+
+            # Only takes effect on a new DB file; existing files need a one-off VACUUM
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+            # WAL lets readers keep going while a worker commits a claim or status update
+            cursor.execute('PRAGMA journal_mode = WAL')
+            cursor.fetchall()
+
+            # Hold the write lock for the whole setup so concurrently starting
+            # processes don't race on the column migration or checkpoint row
+            cursor.execute('BEGIN IMMEDIATE')
+
             # Create emails table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS emails (
@@ -43,10 +73,46 @@ class Database:
                     retry_count INTEGER DEFAULT 0,
                     from_rule_name TEXT(255),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP,
+                    worker_id TEXT,
+                    lease_expires_at TIMESTAMP,
                     FOREIGN KEY (email_id) REFERENCES emails (id)
                 )
             ''')
             
+            # Add columns to action_queue tables created before retention and multi-worker claiming
+            cursor.execute('PRAGMA table_info(action_queue)')
+            action_queue_columns = [row[1] for row in cursor.fetchall()]
+            for column, column_type in (('completed_at', 'TIMESTAMP'), ('worker_id', 'TEXT'),
+                                        ('lease_expires_at', 'TIMESTAMP')):
+                if column not in action_queue_columns:
+                    cursor.execute(f'ALTER TABLE action_queue ADD COLUMN {column} {column_type}')
+            if 'completed_at' not in action_queue_columns:
+                # Best available guess for rows finished before completed_at was tracked
+                cursor.execute('''
+                    UPDATE action_queue
+                    SET completed_at = created_at
+                    WHERE status IN ('success', 'failed')
+                ''')
+
+            # Keep queue polls and retention scans on indexes instead of full table scans
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_action_queue_status_created
+                ON action_queue (status, created_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_action_queue_status_completed
+                ON action_queue (status, completed_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_action_queue_email_id
+                ON action_queue (email_id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_emails_processed_fetched
+                ON emails (is_processed, fetched_at)
+            ''')
+
             # Initialize checkpoint if it doesn't exist
             cursor.execute('SELECT COUNT(*) FROM checkpoint')
             if cursor.fetchone()[0] == 0:
@@ -114,15 +180,56 @@ class Database:
             return [dict(zip([col[0] for col in cursor.description], row)) 
                     for row in cursor.fetchall()]
 
-    def update_action_status(self, action_id: int, status: str, retry_count: int = 0):
+    def claim_pending_actions(self, worker_id: str, batch_size: int = 10,
+                              lease_seconds: int = 300) -> List[Dict[str, str]]:
+        """Atomically lease up to `batch_size` of the oldest unleased pending actions to `worker_id`.
+
+        Pending rows whose lease has expired (e.g. the worker crashed) are claimable again.
+        """
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE action_queue 
-                SET status = ?, retry_count = ?
-                WHERE id = ?
-            ''', (status, retry_count, action_id))
+                UPDATE action_queue
+                SET worker_id = ?, lease_expires_at = datetime('now', ?)
+                WHERE id IN (
+                    SELECT id FROM action_queue
+                    WHERE status = 'pending'
+                      AND (lease_expires_at IS NULL OR lease_expires_at < datetime('now'))
+                    ORDER BY created_at ASC, id ASC
+                    LIMIT ?
+                )
+                RETURNING *
+            ''', (worker_id, f'+{int(lease_seconds)} seconds', batch_size))
+            columns = [col[0] for col in cursor.description]
+            actions = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            conn.commit()
+            # RETURNING gives no ordering guarantee
+            return sorted(actions, key=lambda action: (action['created_at'], action['id']))
+
+    def update_action_status(self, action_id: int, status: str, retry_count: int = 0, retry_delay: int = 0,
+                             worker_id: Optional[str] = None) -> bool:
+        """Set an action's status and release its lease.
+
+        A retry keeps a lease with no owner for `retry_delay` seconds so it isn't claimed again straight away.
+        With `worker_id`, the update only applies while that worker still holds the row; returns False when
+        the lease was lost to another worker.
+        """
+        query = '''
+            UPDATE action_queue 
+            SET status = ?, retry_count = ?, worker_id = NULL,
+                lease_expires_at = CASE WHEN ? > 0 THEN datetime('now', ?) END,
+                completed_at = CASE WHEN ? IN ('success', 'failed') THEN CURRENT_TIMESTAMP END
+            WHERE id = ?
+        '''
+        params = [status, retry_count, retry_delay, f'+{int(retry_delay)} seconds', status, action_id]
+        if worker_id is not None:
+            query += ' AND worker_id = ?'
+            params.append(worker_id)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
             conn.commit()
+            return cursor.rowcount > 0
 
     def get_email(self, email_id: str) -> Optional[Dict[str, str]]:
         with sqlite3.connect(self.db_path) as conn:
@@ -145,3 +252,121 @@ class Database:
                    WHERE id = ?
             ''', (email['id'],))
             conn.commit()
+
+    def _attach_archive(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
+        cursor.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.emails (
+                id TEXT PRIMARY KEY,
+                sender TEXT,
+                subject TEXT,
+                snippet TEXT,
+                received DATETIME,
+                is_read BOOLEAN,
+                is_processed BOOLEAN,
+                fetched_at TIMESTAMP,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.action_queue (
+                id INTEGER PRIMARY KEY,
+                email_id TEXT,
+                action TEXT,
+                status TEXT,
+                retry_count INTEGER,
+                from_rule_name TEXT(255),
+                created_at TIMESTAMP,
+                completed_at TIMESTAMP,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+
+    def _archive_in_batches(self, table: str, columns: List[str], selector: str, params: tuple,
+                            batch_size: int, max_attempts: int = 3) -> int:
+        # Each batch takes the write lock up front (BEGIN IMMEDIATE) and holds it only for one
+        # copy + delete, so it waits its turn behind claims instead of failing mid-transaction.
+        # The batch's ids are picked once so the copy and the delete always cover the same rows.
+        column_list = ', '.join(columns)
+        archived = 0
+        attempts = 0
+        with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+            self._attach_archive(conn)
+            cursor = conn.cursor()
+            while True:
+                try:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute(selector, params + (batch_size,))
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if ids:
+                        placeholders = ', '.join('?' * len(ids))
+                        cursor.execute(f'''
+                            INSERT OR REPLACE INTO archive.{table} ({column_list})
+                            SELECT {column_list} FROM main.{table}
+                            WHERE id IN ({placeholders})
+                        ''', ids)
+                        cursor.execute(f'DELETE FROM main.{table} WHERE id IN ({placeholders})', ids)
+                    cursor.execute('COMMIT')
+                except sqlite3.OperationalError as e:
+                    if conn.in_transaction:
+                        cursor.execute('ROLLBACK')
+                    if 'locked' not in str(e):
+                        raise
+                    attempts += 1
+                    if attempts >= max_attempts:
+                        logger.warning(f"Skipping {table} archiving until next run: {str(e)}")
+                        return archived
+                    time.sleep(attempts)
+                    continue
+                attempts = 0
+                archived += len(ids)
+                if len(ids) < batch_size:
+                    return archived
+
+    def archive_old_actions(self, batch_size: int = 500) -> int:
+        archived = 0
+        for status in ('success', 'failed'):
+            days = self.retention_days.get(status)
+            if days is None:
+                continue
+            # completed_at is written by SQLite's CURRENT_TIMESTAMP, i.e. UTC
+            cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+            archived += self._archive_in_batches('action_queue', ACTION_QUEUE_COLUMNS, '''
+                SELECT id FROM main.action_queue
+                WHERE status = ? AND completed_at < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (status, cutoff.strftime('%Y-%m-%d %H:%M:%S')), batch_size)
+        return archived
+
+    def archive_old_emails(self, batch_size: int = 500) -> int:
+        # Emails are only archived once none of their actions are left in the hot DB
+        days = self.retention_days.get('emails')
+        if days is None:
+            return 0
+        # fetched_at is written by add_email in local time
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+        return self._archive_in_batches('emails', EMAIL_COLUMNS, '''
+            SELECT e.id FROM main.emails e
+            WHERE e.is_processed = true
+              AND e.fetched_at < ?
+              AND NOT EXISTS (SELECT 1 FROM main.action_queue a WHERE a.email_id = e.id)
+            ORDER BY e.id
+            LIMIT ?
+        ''', (cutoff.isoformat(sep=' '),), batch_size)
+
+    def incremental_vacuum(self, pages: int = 1000):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'PRAGMA incremental_vacuum({int(pages)})')
+            cursor.fetchall()
+
+    def run_retention(self, batch_size: int = 500, vacuum_pages: int = 1000) -> Dict[str, int]:
+        archived = {
+            'actions': self.archive_old_actions(batch_size),
+            'emails': self.archive_old_emails(batch_size),
+        }
+        self.incremental_vacuum(vacuum_pages)
+        return archived
@@ -0,0 +1,20 @@
+import time
+import logging
+from database import Database
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    db = Database()
+
+    while True:
+        try:
+            archived = db.run_retention()
+            logger.info(f"Archived {archived['actions']} actions and {archived['emails']} emails")
+        except Exception as e:
+            logger.error(f"Error in retention: {str(e)}")
+        time.sleep(3600)  # Run hourly
+
+if __name__ == '__main__':
+    main()
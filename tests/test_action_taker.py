@@ -1,6 +1,6 @@
 import unittest
-from unittest.mock import patch, MagicMock
-from action_taker import execute_action, authenticate
+from unittest.mock import patch, MagicMock, call
+from action_taker import execute_action, authenticate, process_pending_actions
 from database import Database
 
 class TestActionTaker(unittest.TestCase):
@@ -63,5 +63,55 @@ class TestActionTaker(unittest.TestCase):
             creds = authenticate()
             self.assertEqual(creds, 'mock_credentials')
 
+class TestProcessPendingActions(unittest.TestCase):
+    def setUp(self):
+        self.mock_service = MagicMock()
+        self.mock_db = MagicMock(spec=Database)
+        self.mock_db.update_action_status.return_value = True
+        self.worker_id = 'host:1'
+
+    def _claim(self, retry_count: int):
+        self.mock_db.claim_pending_actions.return_value = [
+            {'id': 1, 'email_id': 'test_email_id', 'action': 'mark_as_read', 'retry_count': retry_count}
+        ]
+
+    def test_success_marks_action_success(self):
+        self._claim(0)
+        with patch('action_taker.execute_action', return_value=True):
+            processed = process_pending_actions(self.mock_service, self.mock_db, self.worker_id)
+        self.assertEqual(processed, 1)
+        self.mock_db.claim_pending_actions.assert_called_once_with(self.worker_id)
+        self.mock_db.update_action_status.assert_called_once_with(1, 'success', worker_id=self.worker_id)
+
+    def test_failure_retries_with_backoff(self):
+        with patch('action_taker.execute_action', return_value=False):
+            self._claim(0)
+            process_pending_actions(self.mock_service, self.mock_db, self.worker_id)
+            self._claim(1)
+            process_pending_actions(self.mock_service, self.mock_db, self.worker_id)
+        self.assertEqual(self.mock_db.update_action_status.call_args_list, [
+            call(1, 'pending', 1, 5, worker_id=self.worker_id),
+            call(1, 'pending', 2, 10, worker_id=self.worker_id),
+        ])
+
+    def test_final_failure_marks_action_failed(self):
+        self._claim(2)
+        with patch('action_taker.execute_action', return_value=False):
+            process_pending_actions(self.mock_service, self.mock_db, self.worker_id)
+        self.mock_db.update_action_status.assert_called_once_with(1, 'failed', worker_id=self.worker_id)
+
+    def test_lost_lease_logs_warning(self):
+        self._claim(0)
+        self.mock_db.update_action_status.return_value = False
+        with patch('action_taker.execute_action', return_value=True), \
+                self.assertLogs('action_taker', level='WARNING') as logs:
+            process_pending_actions(self.mock_service, self.mock_db, self.worker_id)
+        self.assertIn('Lease on action 1 was lost', logs.output[0])
+
+    def test_no_pending_actions(self):
+        self.mock_db.claim_pending_actions.return_value = []
+        self.assertEqual(process_pending_actions(self.mock_service, self.mock_db, self.worker_id), 0)
+        self.mock_db.update_action_status.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from database import Database
+
+class SlowArchiveCursor(sqlite3.Cursor):
+    # Pauses after copying a batch so rows can cross the TTL before the delete runs
+    def execute(self, sql, *args):
+        result = super().execute(sql, *args)
+        if 'INSERT OR REPLACE INTO archive.' in sql:
+            time.sleep(2.1)
+        return result
+
+class SlowArchiveConnection(sqlite3.Connection):
+    def cursor(self, factory=SlowArchiveCursor):
+        return super().cursor(factory)
+
+class TestDatabaseRetention(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'rulemate.db')
+        self.archive_path = os.path.join(self.tmp_dir.name, 'rulemate_archive.db')
+        self.db = Database(self.db_path, self.archive_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _add_email(self, email_id: str, fetched_days_ago: int = 0):
+        self.db.add_email({
+            'id': email_id,
+            'sender': 'test@example.com',
+            'subject': 'Test Subject',
+            'snippet': 'snippet',
+            'received': '2024-01-01',
+            'is_read': False
+        })
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE emails
+                SET is_processed = true, fetched_at = datetime('now', 'localtime', ?)
+                WHERE id = ?
+            ''', (f'-{fetched_days_ago} days', email_id))
+
+    def _add_action(self, email_id: str, status: str, created_days_ago: int):
+        self.db.add_action(email_id, 'mark_as_read', 'Test Rule')
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE action_queue
+                SET status = ?, created_at = datetime('now', ?),
+                    completed_at = CASE WHEN ? IN ('success', 'failed') THEN datetime('now', ?) END
+                WHERE id = (SELECT MAX(id) FROM action_queue)
+            ''', (status, f'-{created_days_ago} days', status, f'-{created_days_ago} days'))
+
+    def _count(self, path: str, table: str) -> int:
+        with sqlite3.connect(path) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_archive_old_actions_respects_status_ttl(self):
+        self._add_email('email_1')
+        self._add_action('email_1', 'success', 31)
+        self._add_action('email_1', 'success', 1)
+        self._add_action('email_1', 'failed', 31)
+        self._add_action('email_1', 'pending', 365)
+
+        self.assertEqual(self.db.archive_old_actions(), 1)
+        self.assertEqual(self._count(self.db_path, 'action_queue'), 3)
+        self.assertEqual(self._count(self.archive_path, 'action_queue'), 1)
+        self.assertEqual(len(self.db.get_pending_actions()), 1)
+
+    def test_archive_old_actions_counts_from_completion(self):
+        self._add_email('email_1')
+        self._add_action('email_1', 'pending', 365)
+        self.db.update_action_status(1, 'success')
+
+        self.assertEqual(self.db.archive_old_actions(), 0)
+        self.assertEqual(self._count(self.db_path, 'action_queue'), 1)
+
+    def test_archive_old_actions_in_batches(self):
+        self._add_email('email_1')
+        for _ in range(5):
+            self._add_action('email_1', 'success', 31)
+
+        self.assertEqual(self.db.archive_old_actions(batch_size=2), 5)
+        self.assertEqual(self._count(self.db_path, 'action_queue'), 0)
+        self.assertEqual(self._count(self.archive_path, 'action_queue'), 5)
+
+    def test_archive_old_actions_while_claiming(self):
+        self._add_email('email_1')
+        self._add_action('email_1', 'success', 31)
+        self.db.add_action('email_1', 'mark_as_read', 'Test Rule')
+
+        # A worker is mid-claim holding the write lock when archiving starts
+        claimer = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        claimer.execute('BEGIN IMMEDIATE')
+        claimer.execute("UPDATE action_queue SET worker_id = 'worker_a' WHERE status = 'pending'")
+        release = threading.Timer(0.3, lambda: claimer.execute('COMMIT'))
+        release.start()
+        try:
+            archived = self.db.archive_old_actions()
+        finally:
+            release.join()
+            claimer.close()
+
+        self.assertEqual(archived, 1)
+        self.assertEqual(self._count(self.archive_path, 'action_queue'), 1)
+        self.assertEqual(self.db.get_pending_actions()[0]['worker_id'], 'worker_a')
+
+    def test_archive_never_deletes_rows_it_did_not_copy(self):
+        self._add_email('email_1')
+        self._add_action('email_1', 'success', 31)
+        self.db.add_action('email_1', 'mark_as_read', 'Test Rule')
+        with sqlite3.connect(self.db_path) as conn:
+            # Crosses the 30 day TTL about a second after archiving starts
+            conn.execute('''
+                UPDATE action_queue
+                SET status = 'success', completed_at = datetime('now', '-30 days', '+1 seconds')
+                WHERE id = 2
+            ''')
+
+        connect = sqlite3.connect
+        with patch('database.sqlite3.connect',
+                   side_effect=lambda *args, **kwargs: connect(*args, factory=SlowArchiveConnection, **kwargs)):
+            archived = self.db.archive_old_actions()
+
+        self.assertEqual(self._count(self.archive_path, 'action_queue'), archived)
+        self.assertEqual(self._count(self.db_path, 'action_queue') + archived, 2)
+
+    def test_archive_old_emails_waits_for_actions(self):
+        self._add_email('email_1', fetched_days_ago=91)
+        self._add_email('email_2', fetched_days_ago=91)
+        self._add_email('email_3', fetched_days_ago=1)
+        self._add_action('email_2', 'pending', 91)
+
+        self.assertEqual(self.db.archive_old_emails(), 1)
+        self.assertIsNone(self.db.get_email('email_1'))
+        self.assertIsNotNone(self.db.get_email('email_2'))
+        self.assertIsNotNone(self.db.get_email('email_3'))
+
+    def test_run_retention_uses_custom_ttl(self):
+        db = Database(self.db_path, self.archive_path, retention_days={'success': 0})
+        self._add_email('email_1')
+        self._add_action('email_1', 'success', 1)
+
+        archived = db.run_retention()
+        self.assertEqual(archived['actions'], 1)
+        self.assertEqual(archived['emails'], 0)
+
+class TestDatabaseClaiming(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'rulemate.db')
+        self.db = Database(self.db_path, os.path.join(self.tmp_dir.name, 'rulemate_archive.db'))
+        for _ in range(5):
+            self.db.add_action('email_1', 'mark_as_read', 'Test Rule')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_claim_pending_actions_is_exclusive(self):
+        first = self.db.claim_pending_actions('worker_a', batch_size=3)
+        second = self.db.claim_pending_actions('worker_b', batch_size=3)
+
+        self.assertEqual([action['id'] for action in first], [1, 2, 3])
+        self.assertEqual([action['id'] for action in second], [4, 5])
+        self.assertTrue(all(action['worker_id'] == 'worker_a' for action in first))
+        self.assertEqual(self.db.claim_pending_actions('worker_c'), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        self.db.claim_pending_actions('worker_a', batch_size=5)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE action_queue SET lease_expires_at = datetime('now', '-1 seconds') WHERE id = 2")
+
+        reclaimed = self.db.claim_pending_actions('worker_b')
+        self.assertEqual([action['id'] for action in reclaimed], [2])
+        self.assertEqual(reclaimed[0]['worker_id'], 'worker_b')
+
+    def test_update_action_status_releases_lease(self):
+        claimed = self.db.claim_pending_actions('worker_a', batch_size=1)
+        self.db.update_action_status(claimed[0]['id'], 'pending', 1)
+
+        reclaimed = self.db.claim_pending_actions('worker_b', batch_size=1)
+        self.assertEqual(reclaimed[0]['id'], claimed[0]['id'])
+        self.assertEqual(reclaimed[0]['retry_count'], 1)
+
+    def test_retried_action_waits_for_backoff(self):
+        claimed = self.db.claim_pending_actions('worker_a', batch_size=1)
+        self.db.update_action_status(claimed[0]['id'], 'pending', 1, retry_delay=60)
+
+        self.assertNotIn(claimed[0]['id'], [action['id'] for action in self.db.claim_pending_actions('worker_b')])
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE action_queue SET lease_expires_at = datetime('now', '-1 seconds') WHERE id = ?",
+                         (claimed[0]['id'],))
+        self.assertEqual(self.db.claim_pending_actions('worker_b')[0]['id'], claimed[0]['id'])
+
+    def test_stale_worker_update_is_ignored(self):
+        claimed = self.db.claim_pending_actions('worker_a', batch_size=1)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE action_queue SET lease_expires_at = datetime('now', '-1 seconds') WHERE id = ?",
+                         (claimed[0]['id'],))
+        reclaimed = self.db.claim_pending_actions('worker_b', batch_size=1)
+        self.assertEqual(reclaimed[0]['id'], claimed[0]['id'])
+
+        self.assertFalse(self.db.update_action_status(claimed[0]['id'], 'failed', worker_id='worker_a'))
+        self.assertTrue(self.db.update_action_status(claimed[0]['id'], 'pending', 1, worker_id='worker_b'))
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute('SELECT status, retry_count FROM action_queue WHERE id = ?',
+                               (claimed[0]['id'],)).fetchone()
+        self.assertEqual(row, ('pending', 1))
+
+    def test_existing_action_queue_is_migrated(self):
+        legacy_path = os.path.join(self.tmp_dir.name, 'legacy.db')
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute('''
+                CREATE TABLE action_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email_id TEXT,
+                    action TEXT,
+                    status TEXT,
+                    retry_count INTEGER DEFAULT 0,
+                    from_rule_name TEXT(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        db = Database(legacy_path, os.path.join(self.tmp_dir.name, 'legacy_archive.db'))
+        db.add_action('email_1', 'mark_as_read', 'Test Rule')
+        self.assertEqual(len(db.claim_pending_actions('worker_a')), 1)
+
+    def test_concurrent_startup_migrates_once(self):
+        legacy_path = os.path.join(self.tmp_dir.name, 'legacy.db')
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute('''
+                CREATE TABLE action_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email_id TEXT,
+                    action TEXT,
+                    status TEXT,
+                    retry_count INTEGER DEFAULT 0,
+                    from_rule_name TEXT(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        errors = []
+
+        def start():
+            try:
+                Database(legacy_path, os.path.join(self.tmp_dir.name, 'legacy_archive.db'))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+    unittest.main()